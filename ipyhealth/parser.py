@@ -8,23 +8,22 @@ import os
 import re
 import math
 import json
-import string
 import logging
 from typing import Union
+from functools import lru_cache
 from datetime import datetime
 from inspect import currentframe
 from unicodedata import normalize
 from xml.etree import ElementTree
-from multiprocessing import Process
-from collections import ChainMap
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import defaultdict
 from tqdm import tqdm
 from pytz import timezone
 from dateutil.parser import parse
+from dateutil.tz import tzoffset
 
-import gpxpy
-import gpxpy.gpx
 import pandas as pd
-from inflection import underscore
+import inflection
 
 from . import templates
 
@@ -33,14 +32,151 @@ try:
 except ImportError:
     import importlib_resources as pkg_resources
 
-PUNC = string.punctuation.replace('.', '')
+try:
+    from xml.parsers import expat
+except ImportError:
+    expat = None
+
+try:
+    from lxml import etree
+    HAS_LXML = True
+except ImportError:
+    etree = ElementTree
+    HAS_LXML = False
+
 template = pkg_resources.read_text(templates, 'activity_format.json')
 NODES = json.loads(template)
+for node_format in NODES.values():
+    if 'pattern' in node_format:
+        node_format['pattern_re'] = re.compile(node_format['pattern'])
+PARALLEL_THRESHOLD = 50000
+CATEGORIES = [
+    'activity', 'activity_type', 'source_name', 'source_version', 'unit',
+    'device_name', 'device_manufacturer', 'device_model', 'device_hardware',
+    'device_software'
+]
+GPX_NAMESPACE = '{http://www.topografix.com/GPX/1/1}'
+STANDARD_UNITS = {
+    'duration': ('min', {'min': 1, 'sec': 60}),
+    'distance': ('km', {'km': 1, 'm': 1000}),
+    'energy_burned': ('kcal', {'kcal': 1, 'cal': 1000}),
+}
+underscore = lru_cache(maxsize=None)(inflection.underscore)
+FILE_DATE = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
+DEVICE = re.compile(r'(\w+)\s*:\s*([^,>]+?)(?=\s*[,>])')
+TIMESTAMP = re.compile(
+    r'^(\d{4})-(\d{2})-(\d{2})'
+    r'(?: (\d{2}):(\d{2}):(\d{2})(?: ([+-])(\d{2})(\d{2}))?)?$'
+)
+
+
+@lru_cache(maxsize=None)
+def _get_tzinfo(sign: str, hours: str, minutes: str) -> tzoffset:
+    """Return the (cached) fixed offset timezone, i.e. +0200"""
+    offset = (int(hours) * 60 + int(minutes)) * 60
+    return tzoffset(None, -offset if sign == '-' else offset)
+
+
+def _fast_parse_ts(timestamp: str) -> datetime:
+    """Parse the timestamps used by Apple Health, such as
+    2020-04-06 07:31:42 +0200 or 2020-04-06, without going through dateutil.
+    Any other format falls back to dateutil's parser.
+
+    Args:
+        timestamp: the timestamp string
+
+    Returns:
+        date: the parsed datetime, timezone aware if an offset is given
+    """
+
+    match = TIMESTAMP.match(timestamp)
+    if match is None:
+        return parse(timestamp)
+
+    year, month, day, hour, minute, second, sign, hours, minutes = \
+        match.groups()
+    tzinfo = _get_tzinfo(sign, hours, minutes) if sign else None
+
+    return datetime(
+        int(year), int(month), int(day),
+        int(hour or 0), int(minute or 0), int(second or 0),
+        tzinfo=tzinfo
+    )
+
+
+def _read_nodes(source, tags: tuple, filters: dict) -> dict:
+    """Read the attributes of the children of the root node whose tag is in
+    tags with expat, without creating any element nodes. Nested nodes with a
+    matching tag are skipped, as in _iter_nodes.
+
+    Args:
+        source: the xml file object, opened in binary mode
+        tags: the node tags to read
+        filters: the checks on the node attributes by node tag, nodes that
+            fail the check of their tag are not kept
+
+    Returns:
+        by_tag: the node attributes, grouped by node tag
+    """
+
+    by_tag = defaultdict(list)
+    tags = frozenset(tags)
+    depth = 0
+
+    def start(name, attributes):
+        nonlocal depth
+        depth += 1
+
+        if depth == 2 and name in tags:
+            keep = filters.get(name)
+            if keep is None or keep(attributes):
+                by_tag[name].append(attributes)
+
+    def end(_):
+        nonlocal depth
+        depth -= 1
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.ParseFile(source)
+
+    return by_tag
+
+
+def _iter_nodes(source, tags: tuple):
+    """Stream the children of the root node whose tag is in tags with lxml,
+    the fallback to _read_nodes when expat is not available.
+
+    Each node is cleared once it has been consumed, so memory is bounded by
+    a single node instead of the whole document. Nested nodes with a
+    matching tag (i.e. a WorkoutRoute inside a Workout) are skipped.
+
+    Args:
+        source: the xml file (or file object) to parse
+        tags: the node tags to return
+
+    Yields:
+        node: the element node, only valid until the next node is requested
+    """
+
+    for _, node in etree.iterparse(source, events=('end',), tag=tags):
+        parent = node.getparent()
+        if parent is None or parent.getparent() is not None:
+            continue
+
+        yield node
+
+        node.clear()
+        while node.getprevious() is not None:
+            del parent[0]
 
 
 class AppleHealthFormatter():
     """The Formatter object formats the Apple Health data records."""
 
+    __slots__ = ('node_tag', 'attributes', 'values')
+
     def __init__(self, node_tag: str, node: dict):
         """The Formatter object formats the Apple Health data records.
 
@@ -58,14 +194,15 @@ class AppleHealthFormatter():
         """Format the type activity type based on the regex pattern provided
 
         Args:
-            inputs[0] (str): the regex pattern for identifying the type of
-                activity, such as r"^HK(.+)ActivityType(.+)$"
+            inputs[0] (str or re.Pattern): the regex pattern for identifying
+                the type of activity, such as r"^HK(.+)ActivityType(.+)$"
             inputs[1] (str): the activity attribute, such as HKWorkoutTypeYoga
 
         Returns:
             {activity_type, activity}: a dictionary on the activity attribute
         """
-        activity_type, activity = re.findall(inputs[0], inputs[1])[0]
+        match = re.compile(inputs[0]).match(inputs[1])
+        activity_type, activity = match.group(1), match.group(2)
         return {'activity_type': activity_type, 'activity': activity}
 
     @staticmethod
@@ -89,22 +226,17 @@ class AppleHealthFormatter():
     def format_date(inputs: (str, str)) -> (str, datetime):
         """Return the snake style column name and format string input to
         date object"""
-        return underscore(inputs[0]), parse(inputs[1])
+        return underscore(inputs[0]), _fast_parse_ts(inputs[1])
 
     @staticmethod
     def format_device(device_string: (str, str)) -> dict:
         """Return the snake style column names and format device string input
         to multiple device values"""
 
-        def clean_device_info(device):
-            info = device.split(":")
-            key = f"device_{info[0].strip(PUNC).strip().lower()}"
-            val = ':'.join(info[1:]).strip(PUNC).strip()
-            return {key: val}
-
-        devices = [d for d in device_string.split(',') if ':' in d]
-
-        return dict(ChainMap(*map(clean_device_info, devices)))
+        return {
+            f"device_{key.lower()}": val.strip()
+            for key, val in DEVICE.findall(device_string)
+        }
 
     @staticmethod
     def format_standard(inputs: (str, str)) -> (str, float):
@@ -151,36 +283,31 @@ class AppleHealthFormatter():
 
             if ftype != 'standard':
 
-                attr_vals = []
-                for aname in attr_names:
-                    try:
-                        attr_vals.append(self.attributes[aname])
-                    except KeyError:
-                        pass
+                present = [
+                    (aname, self.attributes[aname])
+                    for aname in attr_names if aname in self.attributes
+                ]
+                names, attr_vals = zip(*present) if present else ((), ())
 
                 if ftype == 'type':
-                    patterns = [
-                        NODES[self.node_tag]['pattern']
-                    ]*len(attr_names)
-                    d = list(
-                        map(self.format_type, zip(patterns, attr_vals))
-                    )[0]
+                    d = self.format_type(
+                        (NODES[self.node_tag]['pattern_re'], attr_vals[0])
+                    )
 
                 elif ftype == 'string':
-                    d = map(self.format_string, zip(attr_names, attr_vals))
+                    d = map(self.format_string, zip(names, attr_vals))
 
                 elif ftype == 'no_format':
-                    d = map(self.format_no_format, zip(attr_names, attr_vals))
+                    d = map(self.format_no_format, zip(names, attr_vals))
 
                 elif ftype == 'device':
-                    if attr_vals:
-                        d = list(map(self.format_device, attr_vals))[0]
+                    d = self.format_device(attr_vals[0]) if attr_vals else {}
 
                 elif ftype == 'date':
-                    d = map(self.format_date, zip(attr_names, attr_vals))
+                    d = map(self.format_date, zip(names, attr_vals))
 
                 elif ftype == 'numerics':
-                    d = map(self.format_numerics, zip(attr_names, attr_vals))
+                    d = map(self.format_numerics, zip(names, attr_vals))
                 else:
                     raise NotImplementedError(f"{self.attributes} not\
                 implemented.")
@@ -194,11 +321,165 @@ class AppleHealthFormatter():
                     zip(attr_type, attr_vals, attr_units)
                 )
 
-            formatted_vals = {**formatted_vals, **dict(d)}
+            formatted_vals.update(d)
 
         return formatted_vals
 
 
+def _to_datetime(values: pd.Series) -> pd.Series:
+    """Convert a column of Apple Health timestamps to datetimes in UTC, or to
+    naive datetimes for dates without time, such as dateComponents"""
+
+    try:
+        return pd.to_datetime(
+            values, format='%Y-%m-%d %H:%M:%S %z', utc=True, cache=True)
+    except ValueError:
+        return pd.to_datetime(values, cache=True)
+
+
+def _format_devices(devices: pd.Series) -> pd.DataFrame:
+    """Split a column of device strings into the device columns, parsing
+    each distinct device string only once"""
+
+    parsed = {
+        device: AppleHealthFormatter.format_device(device)
+        for device in devices.dropna().unique()
+    }
+
+    return pd.DataFrame(
+        [parsed.get(device, {}) for device in devices],
+        index=devices.index
+    )
+
+
+def _standardize(name: str, values: pd.Series, units: pd.Series) -> pd.Series:
+    """Standardize a column of duration, distance or energy burned into the
+    same unit (minute, km and kcal), see AppleHealthFormatter.format_standard
+    """
+
+    key = underscore(name.replace('total', ''))
+
+    try:
+        unit, divisors = STANDARD_UNITS[key]
+    except KeyError:
+        raise NotImplementedError(f"Unit {key} not implemented.")
+
+    divisor = units.map(divisors)
+    unknown = units[units.notna() & divisor.isna()]
+    if len(unknown) > 0:
+        raise NotImplementedError(f"Unit {unknown.iloc[0]} not implemented.")
+
+    return (values.astype(float) / divisor).rename(f'{key}_{unit}')
+
+
+def _format_frame(node_tag: str, nodes: list) -> pd.DataFrame:
+    """Format the node attributes column by column rather than node by node,
+    producing the same columns as AppleHealthFormatter.
+
+    Args:
+        node_tag: the tag of the element,
+            i.e. ['Workout', 'Record', 'ActivitySummary]
+        nodes: the attributes of the nodes with the node_tag
+
+    Returns:
+        df: a pandas dataframe with a row per node
+    """
+
+    raw = pd.DataFrame(nodes)
+    columns = []
+
+    if raw.empty:
+        return raw
+
+    for ftype, attr_names in NODES[node_tag]['formats'].items():
+
+        if ftype == 'standard':
+            for attr_name, unit_name in attr_names:
+                if attr_name in raw and unit_name in raw:
+                    columns.append(
+                        _standardize(attr_name, raw[attr_name], raw[unit_name])
+                    )
+            continue
+
+        for attr_name in attr_names:
+
+            if attr_name not in raw:
+                continue
+
+            values = raw[attr_name]
+            col_name = underscore(attr_name)
+
+            if ftype == 'type':
+                column = values.str.extract(NODES[node_tag]['pattern_re'])
+                column.columns = ['activity_type', 'activity']
+
+            elif ftype == 'string':
+                column = values.str.normalize('NFKD').rename(col_name)
+
+            elif ftype == 'no_format':
+                column = values.rename(col_name)
+
+            elif ftype == 'device':
+                column = _format_devices(values)
+
+            elif ftype == 'date':
+                column = _to_datetime(values).rename(col_name)
+
+            elif ftype == 'numerics':
+                column = pd.to_numeric(
+                    values, errors='coerce', downcast='float'
+                ).rename(col_name)
+
+            else:
+                raise NotImplementedError(f"{ftype} not implemented.")
+
+            columns.append(column)
+
+    return pd.concat(columns, axis=1)
+
+
+def _parse_gpx(path: str) -> pd.DataFrame:
+    """Read the track points of the first track segment of a workout routes
+    (.gpx) file by streaming the trkpt nodes, without building the full gpx
+    object model.
+
+    Args:
+        path: the full filepath and filename of the .gpx file
+
+    Returns:
+        df: a pandas dataframe with the latitude, longitude, elevation and
+            time of each track point
+    """
+
+    trkseg = f'{GPX_NAMESPACE}trkseg'
+    trkpt = f'{GPX_NAMESPACE}trkpt'
+    options = {'tag': (trkseg, trkpt)} if HAS_LXML else {}
+    points = {'latitude': [], 'lonitude': [], 'elevation': [], 'time': []}
+    segment = None
+
+    for event, node in etree.iterparse(
+            path, events=('start', 'end'), **options):
+
+        if node.tag == trkseg:
+            if event == 'end':
+                break
+            segment = node
+
+        elif node.tag == trkpt and event == 'end' and segment is not None:
+            points['latitude'].append(node.get('lat'))
+            points['lonitude'].append(node.get('lon'))
+            points['elevation'].append(node.findtext(f'{GPX_NAMESPACE}ele'))
+            points['time'].append(node.findtext(f'{GPX_NAMESPACE}time'))
+            segment.remove(node)
+
+    df = pd.DataFrame(points)
+    for col in ['latitude', 'lonitude', 'elevation']:
+        df[col] = pd.to_numeric(df[col])
+    df['time'] = pd.to_datetime(df['time'], utc=True)
+
+    return df
+
+
 class AppleHealthParser():
     """Creates pandas dataframes of activities, workouts and records based on
     the Apple Health data records."""
@@ -224,17 +505,13 @@ class AppleHealthParser():
 
         self.export_path = in_file
         self.logger = self.get_logger(logger_name, verbose)
-        try:
-            os.makedirs(os.path.join(in_file, 'tmp'))
-        except FileExistsError:
-            pass
 
         self.logger.info('Start extracting health info from export.xml.')
 
         health_file = os.path.join(in_file, 'export.xml')
-        with open(health_file) as ifile:
+        with open(health_file, 'rb') as ifile:
             self.logger.info(f"Read Apple Health data from {in_file}...")
-            self.data = self.get_data(ifile, from_date)
+            self._by_tag = self.get_data(ifile, from_date)
             self.gpx_files = self.get_gpx_files(from_date)
             self.info = self.get_info()
             self.activities = self.create_dataframe('ActivitySummary', nprocs)
@@ -242,7 +519,7 @@ class AppleHealthParser():
             self.records = self.create_dataframe('Record', nprocs)
 
         self.logger.info('Start extracting workout routes.')
-        self.routes = self.create_routes_dataframe()
+        self.routes = self.create_routes_dataframe(nprocs)
 
         if verbose:
             self.report_stats()
@@ -256,50 +533,50 @@ class AppleHealthParser():
             date: the date of the workout routes file created
         """
 
-        try:
-            date = re.search(r'(\d{4}-\d{2}-\d{2})', filename).group(1)
+        match = FILE_DATE.search(filename)
 
-        except AttributeError:
-            self.logger.info('No date found in filename {filename}.')
-            date = '2099-01-01'
+        if match is None:
+            self.logger.info(f'No date found in filename {filename}.')
+            return datetime(2099, 1, 1)
+
+        year, month, day = match.groups()
 
-        return parse(date)
+        return datetime(int(year), int(month), int(day))
 
-    def filter_nodes(
+    def get_node_filters(
             self,
-            node: ElementTree.Element,
-            from_date: datetime) -> Union[ElementTree.Element, None]:
-        """Return node if it is created after from date, else return None
+            from_date: datetime,
+            from_date_local: datetime = None) -> dict:
+        """Return the checks on whether the node attributes are created after
+        from date, by node tag. Nodes with a tag without a check are always
+        kept.
 
         Args:
-            node: the element node
-            from_date: return node if node is created after this date
+            from_date: keep nodes created after this date
+            from_date_local: from_date without timezone, used for the nodes
+                that are not timezone aware
         """
 
-        filtered = None
-
-        if node.tag in ['Record', 'Workout', 'WorkoutRoute']:
-            if parse(node.attrib['creationDate']) >= from_date:
-                filtered = node
-
-        elif node.tag == 'ActivitySummary':
+        if from_date_local is None:
             from_date_local = from_date.replace(tzinfo=None)
 
-            if parse(node.attrib['dateComponents']) >= from_date_local:
-                filtered = node
-
-        elif node.tag == 'FileReference':
+        def created_after(attributes):
+            return _fast_parse_ts(attributes['creationDate']) >= from_date
 
-            file_date = self.get_file_date(node.attrib['path'])
-            from_date_local = from_date.replace(tzinfo=None)
+        def summarized_after(attributes):
+            return _fast_parse_ts(attributes['dateComponents']) >= \
+                from_date_local
 
-            if file_date >= from_date_local:
-                filtered = node
-
-        else:
-            filtered = node
+        def file_after(attributes):
+            return self.get_file_date(attributes['path']) >= from_date_local
 
-        return filtered
+        return {
+            'Record': created_after,
+            'Workout': created_after,
+            'WorkoutRoute': created_after,
+            'ActivitySummary': summarized_after,
+            'FileReference': file_after,
+        }
 
     def get_gpx_files(self, from_date: datetime) -> list:
         """Get the routes (.gpx) data from apple health zip file, then
@@ -313,62 +590,70 @@ class AppleHealthParser():
         """
 
         filepath = os.path.join(self.export_path, 'workout-routes')
-        gpx_files = [f for f in os.listdir(filepath) if f.endswith('.gpx')]
-        filtered_gpx_files = []
-
-        if from_date:
-            from_date_local = from_date.replace(tzinfo=None)
-
-            for gpx_file in gpx_files:
-                file_date = self.get_file_date(gpx_file)
-
-                if file_date >= from_date_local:
-                    filtered_gpx_files.append(gpx_file)
+        from_date_local = from_date.replace(tzinfo=None) if from_date \
+            else None
+
+        with os.scandir(filepath) as entries:
+            gpx_files = [
+                entry.name for entry in entries
+                if entry.name.endswith('.gpx') and (
+                    from_date_local is None or
+                    self.get_file_date(entry.name) >= from_date_local
+                )
+            ]
 
-            return filtered_gpx_files
         return gpx_files
 
-    def get_data(self, ifile: str, from_date: datetime = None) -> list:
-        """Get data from xml, then filter with from_date and the node tags
-        specified in activity_format.json file.
+    def get_data(self, ifile: str, from_date: datetime = None) -> dict:
+        """Stream data from xml, then filter with from_date and the node tags
+        specified in activity_format.json file. The xml is read with expat,
+        or with lxml's iterparse when expat is not available.
 
         Args:
-            ifile: the directory path where apple health data is stored.
+            ifile: the export.xml file object, opened in binary mode
             from_date: to only parase health data after this date
 
         Returns:
-            filtere_nodes: list of nodes filtere by date and node tag
+            by_tag: the node attributes filtered by date, grouped by node tag
         """
 
-        data = ElementTree.parse(ifile)
-        nodes = []
-        filtered_nodes = []
-
-        for tag in list(NODES.keys()):
-            nodes += data.findall(tag)
+        tags = tuple(NODES.keys())
+        filters = {}
 
         if from_date:
             self.logger.info(f'Filter data to from date: {from_date}')
             jhb = timezone('Africa/Johannesburg')
             from_date = jhb.localize(from_date)
+            filters = self.get_node_filters(
+                from_date, from_date.replace(tzinfo=None)
+            )
+
+        if expat is not None:
+            by_tag = _read_nodes(ifile, tags, filters)
+
+        elif HAS_LXML:
+            by_tag = defaultdict(list)
 
-            for node in tqdm(nodes, total=len(nodes)):
-                filtered_node = self.filter_nodes(node, from_date)
-                if filtered_node is not None:
-                    filtered_nodes.append(filtered_node)
+            for node in _iter_nodes(ifile, tags):
+                keep = filters.get(node.tag)
+                if keep is not None and not keep(node.attrib):
+                    continue
+                by_tag[node.tag].append(dict(node.attrib))
 
         else:
-            filtered_nodes = nodes
+            raise ImportError("Reading export.xml requires pyexpat or lxml.")
 
-        return filtered_nodes
+        return dict(by_tag)
 
     def get_nodes(self, tags: Union[str, list]) -> list:
-        """Get nodes from element tree based on node tag"""
+        """Get node attributes based on node tag"""
 
         if isinstance(tags, str):
             tags = [tags]
 
-        nodes = [node.attrib for node in self.data if node.tag in tags]
+        nodes = []
+        for tag in tags:
+            nodes.extend(self._by_tag.get(tag, []))
 
         return nodes
 
@@ -427,7 +712,7 @@ class AppleHealthParser():
         """
 
         try:
-            export_date = parse(export_date["value"])
+            export_date = _fast_parse_ts(export_date["value"])
         except AttributeError:
             self.logger.warning("Export date not available.")
             export_date = None
@@ -442,10 +727,7 @@ class AppleHealthParser():
             'Record', 'Workout', 'ActivitySummary', 'Me', 'ExportDate'
         ]
 
-        n_nodes = len(
-            [node for node in list(self.data)
-             if node.tag in used_tags]
-        )
+        n_nodes = sum(len(self._by_tag.get(tag, [])) for tag in used_tags)
 
         date = datetime.strftime(
             self.info['export_date'],
@@ -480,59 +762,49 @@ class AppleHealthParser():
 
         Args:
             node_tag: the node, such as Workout, Record, ActivitySummary
-            nprocs: the number of processes to use, default to 4
+            nprocs: the number of processes to use for node tags with at
+                least PARALLEL_THRESHOLD nodes, default to 4
 
         Returns:
             df: a pandas dataframe summarizing the apple health
                 data, depending on the node tag.
         """
 
-        def worker(node_tag, node_chunks, export_name):
-            cleaned_vals = []
-            for node in tqdm(node_chunks, total=len(node_chunks)):
-                formatter = AppleHealthFormatter(node_tag, node)
-                cleaned_vals.append(formatter.values)
-            pd.DataFrame(cleaned_vals).to_pickle(export_name)
+        nodes = self.get_nodes(node_tag)
 
-        procs = []
-        names = []
+        if nprocs > 1 and len(nodes) >= PARALLEL_THRESHOLD:
+            chunksize = int(math.ceil(len(nodes) / float(nprocs)))
+            chunks = [
+                nodes[i: i + chunksize]
+                for i in range(0, len(nodes), chunksize)
+            ]
 
-        nodes = self.get_nodes(node_tag)
-        chunksize = int(math.ceil(len(nodes) / float(nprocs)))
-
-        for i in range(nprocs):
-            export_name = os.path.join(
-                self.export_path, 'tmp', f'{node_tag}{i}.pkl')
-            names.append(export_name)
-
-            proc = Process(
-                target=worker,
-                args=(
-                    node_tag,
-                    nodes[chunksize*i: chunksize*(i+1)],
-                    export_name)
-            )
-            procs.append(proc)
-            proc.start()
+            with ProcessPoolExecutor(max_workers=nprocs) as executor:
+                frames = list(executor.map(
+                    _format_frame, [node_tag] * len(chunks), chunks
+                ))
 
-        for proc in procs:
-            proc.join()
+            df = pd.concat(frames, ignore_index=True)
 
-        df = pd.DataFrame()
+        else:
+            df = _format_frame(node_tag, nodes)
 
-        for name in names:
-            tmp = pd.read_pickle(name)
-            df = pd.concat([df, tmp])
-            os.remove(name)
+        for col in CATEGORIES:
+            if col in df:
+                df[col] = df[col].astype('category')
 
         date_col = underscore(NODES[node_tag]['formats']['date'][0])
         df = df.sort_values(by=date_col).reset_index(drop=True)
 
         return df
 
-    def create_routes_dataframe(self) -> pd.DataFrame:
+    def create_routes_dataframe(self, nprocs: int = 4) -> pd.DataFrame:
         """Create workout routes dataframe with the gpx data.
 
+        Args:
+            nprocs: the number of threads used to read the gpx files,
+                default to 4
+
         Returns:
             df: a pandas dataframe summarizing the workout routes, including
                 latitude, longitude, elevation and time of the route logged.
@@ -547,22 +819,22 @@ class AppleHealthParser():
 
         base_df = create_routes_base_df()
 
-        df = pd.DataFrame()
         filepath = os.path.join(self.export_path, 'workout-routes')
+        paths = [os.path.join(filepath, fname) for fname in self.gpx_files]
 
-        for fname in tqdm(self.gpx_files, total=len(self.gpx_files)):
+        with ThreadPoolExecutor(max_workers=nprocs) as executor:
+            frames = list(tqdm(
+                executor.map(_parse_gpx, paths),
+                total=len(paths)
+            ))
 
-            gpx = gpxpy.parse(open(os.path.join(filepath, fname), 'r'))
-
-            tmp = pd.DataFrame([{
-                'filename': os.path.join('/workout-routes', fname),
-                'latitude': point.latitude,
-                'lonitude': point.longitude,
-                'elevation': point.elevation,
-                'time': point.time
-            } for point in gpx.tracks[0].segments[0].points])
+        for fname, frame in zip(self.gpx_files, frames):
+            frame.insert(
+                0, 'filename', os.path.join('/workout-routes', fname)
+            )
 
-            df = pd.concat([df, tmp])
+        df = pd.concat(frames, ignore_index=True) if frames \
+            else pd.DataFrame()
 
         if len(base_df) > 0:
             df = base_df.merge(df, left_on='path', right_on='filename')
@@ -15,7 +15,6 @@ requirements = [
     'pandas>=1.0.0',
     'tqdm>=4.46.0',
     'inflection>=0.4.0',
-    'gpxpy>=1.4.0',
     'geopy>=1.22.0',
     'importlib_resources ; python_version<"3.7"'
 ]
@@ -1,11 +1,14 @@
 # pylint: disable=redefined-outer-name, missing-function-docstring
+# pylint: disable=protected-access
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from collections import Counter
 from xml.etree import ElementTree
 from inflection import underscore
 
 import pytest
+import pandas as pd
+from ipyhealth import parser
 from ipyhealth.parser import AppleHealthFormatter, AppleHealthParser
 
 from . import templates
@@ -71,6 +74,19 @@ def test_get_data():
     assert len(health_data.routes) == 0
 
 
+@pytest.mark.skipif(not parser.HAS_LXML, reason="lxml is not installed")
+@pytest.mark.parametrize("from_date", [None, datetime(2020, 4, 12)])
+def test_get_data_without_expat(monkeypatch, from_date):
+
+    in_file = 'tests/data/apple_health_export/'
+    expat_data = AppleHealthParser(in_file=in_file, from_date=from_date)
+
+    monkeypatch.setattr(parser, 'expat', None)
+    lxml_data = AppleHealthParser(in_file=in_file, from_date=from_date)
+
+    assert lxml_data._by_tag == expat_data._by_tag
+
+
 def test_get_nodes(health_data):
     nodes1 = health_data.get_nodes('Workout')
     nodes2 = health_data.get_nodes(['Workout', 'ActivitySummary'])
@@ -102,6 +118,43 @@ def test_personal_info(health_data):
     assert health_data.info.get('DateOfBirth') == '1989-04-24'
 
 
+@pytest.mark.parametrize(
+    "timestamp, o_date, o_offset",
+    [
+        ('2020-04-06 07:31:42 +0200', datetime(2020, 4, 6, 7, 31, 42),
+         timedelta(hours=2)),
+        ('2020-04-06 07:31:42 -0330', datetime(2020, 4, 6, 7, 31, 42),
+         -timedelta(hours=3, minutes=30)),
+        ('2020-04-06', datetime(2020, 4, 6), None),
+        ('2020-04-06T07:31:42Z', datetime(2020, 4, 6, 7, 31, 42),
+         timedelta(0))
+    ]
+)
+def test_fast_parse_ts(timestamp, o_date, o_offset):
+
+    date = parser._fast_parse_ts(timestamp)
+
+    assert date.replace(tzinfo=None) == o_date
+    assert date.utcoffset() == o_offset
+
+
+def test_fast_parse_ts_fallback(monkeypatch):
+
+    calls = []
+
+    def fake_parse(timestamp):
+        calls.append(timestamp)
+        return datetime(2020, 4, 6)
+
+    monkeypatch.setattr(parser, 'parse', fake_parse)
+
+    parser._fast_parse_ts('2020-04-06 07:31:42 +0200')
+    assert not calls
+
+    parser._fast_parse_ts('2020-04-06T07:31:42Z')
+    assert calls == ['2020-04-06T07:31:42Z']
+
+
 def test_format_date(formatter, workout_node):
 
     name, val = formatter.format_date(
@@ -240,6 +293,29 @@ def test_format_values(formatter, nodes_template):
     }
 
 
+def test_format_values_missing_attribute(record_node):
+
+    attributes = dict(record_node.attrib)
+    attributes.pop('unit')
+    values = AppleHealthFormatter('Record', attributes).values
+
+    assert 'unit' not in values
+    assert values['value'] == record_node.attrib['value']
+
+
+def test_format_frame_missing_standard(workout_node):
+
+    partial = dict(workout_node.attrib)
+    partial.pop('totalDistance')
+    partial.pop('totalDistanceUnit')
+
+    df = parser._format_frame('Workout', [dict(workout_node.attrib), partial])
+
+    assert df.loc[0, 'distance_km'] == 0.0
+    assert df['distance_km'].isna()[1]
+    assert df.loc[1, 'duration_min'] == pytest.approx(55.46542123357455)
+
+
 def test_create_dataframe(health_data):
 
     assert len(health_data.workouts) == 16
@@ -249,10 +325,45 @@ def test_create_dataframe(health_data):
     assert Counter(health_data.records.activity).get('StepCount') == 37
     assert len(health_data.activities) == 8
     assert health_data.activities.loc[0, 'active_energy_burned'] == \
-        408.302
+        pytest.approx(408.302)
+
+
+def test_create_dataframe_parallel(monkeypatch, health_data):
+
+    monkeypatch.setattr(parser, 'PARALLEL_THRESHOLD', 5)
+    in_file = 'tests/data/apple_health_export/'
+    parallel_data = AppleHealthParser(in_file=in_file, nprocs=3)
+
+    for name in ['records', 'workouts', 'activities']:
+        inline = getattr(health_data, name)
+        parallel = getattr(parallel_data, name)
+
+        assert len(parallel) == len(inline)
+        assert set(parallel.columns) == set(inline.columns)
+        for col in parser.CATEGORIES:
+            if col in inline:
+                assert parallel[col].dtype == inline[col].dtype
+        pd.testing.assert_frame_equal(parallel[inline.columns], inline)
 
 
 def test_create_routes_dataframe(health_data):
 
     assert len(health_data.routes.time.dt.date.unique()) == 2
     assert len(health_data.routes) == 35008
+
+
+def test_parse_gpx_first_segment(tmp_path):
+
+    point = '<trkpt lat="{0}" lon="{0}"><ele>1.0</ele>' \
+        '<time>2020-01-18T07:13:15Z</time></trkpt>'
+    gpx = tmp_path / 'route_2020-01-18_5.49pm.gpx'
+    gpx.write_text(
+        '<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">'
+        f'<trk><trkseg>{point.format(1)}{point.format(2)}</trkseg>'
+        f'<trkseg>{point.format(3)}</trkseg></trk>'
+        f'<trk><trkseg>{point.format(4)}</trkseg></trk></gpx>'
+    )
+
+    df = parser._parse_gpx(str(gpx))
+
+    assert list(df.latitude) == [1.0, 2.0]